@@ -1,23 +1,34 @@
 from typing import Dict, Callable
 from generic_client import MCPTesterClient
 from logging import getLogger
-import asyncio, time, psutil, os
+import asyncio, time, psutil
 logger = getLogger(__name__)
 
+KIDS_POLL_EVERY = 5  # re-count children only every N-th decay poll, it is the priciest part of a snapshot
+CPU_MIN_INTERVAL = 0.5  # seconds a cpu_percent() ratio is reused for, see cpu_percent()
+DECAY_POLL_MIN = 0.05  # decay watch backs off from this interval...
+DECAY_POLL_MAX = 1.0   # ...up to this one while readings stay stable
+
+# pid -> (monotonic time, cpu ratio) of the last real cpu_percent() sample
+_cpu_samples: Dict[int, tuple] = {}
+
 async def timeout_tester(client: MCPTesterClient, **kwargs):
     grace = kwargs.get("grace", 5)
 
-    if client.transport_name != "stdio":
+    if client.transport != "stdio":
         raise RuntimeError("timeout_tester only works with stdio transport")
     
     server_id = kwargs.get("server_id", "1")
-    logger.info(f"Running timeout_tester on server {server_id}")
+    tool = kwargs.get("tool")
+    args = kwargs.get("args") or {}
+    if not tool:
+        raise ValueError("timeout_tester needs a tool to call, pass one with --tool")
+    logger.info(f"Running timeout_tester on server {server_id} with tool {tool}")
 
-    stdio_params = client.transport_params[server_id]["server_params"] 
     session = client.sessions[server_id]
     stack = client.exit_stacks[server_id]
 
-    proc = find_stdio_child(cmd_stem=stdio_params.command.split(os.sep)[-1].lower())
+    proc = find_stdio_child(client, server_id)
     base = snapshot(proc)
 
     # Start a long/expensive call (or supply args that force work)
@@ -25,59 +36,113 @@ async def timeout_tester(client: MCPTesterClient, **kwargs):
     await asyncio.sleep(0.2)  # let it start
     # Cancel (or enforce a timeout)
     task.cancel()
+    # asyncio.wait doesn't re-cancel and wait on timeout, so a call that swallows the cancel can't hang the tester
+    await asyncio.wait({task}, timeout=1.0)
+    if not task.done():
+        logger.warning(f"Tool call {tool} still running 1s after cancellation")
+    elif not task.cancelled() and task.exception() is not None:
+        logger.info(f"Tool call {tool} ended with {task.exception()!r} instead of cancelling")
+
+    # Close the session/transport to simulate disconnect
+    await stack.aclose()
+    # drop our reference and yield once so the cancelled task and transport futures finalize
+    task = None
+    await asyncio.sleep(0)
+    _cpu_samples.pop(proc.pid, None)  # state changed, don't let the first poll reuse the baseline cpu ratio
+
+    # Watch for decay back toward baseline in the background, give up after grace seconds
+    state = {"last": None}
+    watch = asyncio.create_task(_decay_watch(proc, base, state))
+    done, _ = await asyncio.wait({watch}, timeout=grace)
+    if watch in done:
+        final = watch.result()
+        # stdio_client's teardown usually ends the server, so there is nothing left to measure
+        status = "terminated" if final.get("dead") else "clean"
+        return {"status": status, "baseline": base, "final": final}
+
+    watch.cancel()
     try:
-        await task
+        await watch
     except asyncio.CancelledError:
         pass
+    return {"status": "suspect_leak", "baseline": base, "final": state["last"]}
 
-    # Close the session/transport to simulate disconnect
-    await stack.aclose()
+## timeout_tester helper functions
+async def _decay_watch(proc: psutil.Process, base: dict, state: dict) -> dict:
+    """
+    Sample proc until it is back near base, or has exited, and return that final snapshot.
+    Polls every DECAY_POLL_MIN seconds, doubling up to DECAY_POLL_MAX while readings stay unchanged.
+    The latest snapshot is kept in state["last"] so the caller can report it on timeout.
+    """
+    interval = DECAY_POLL_MIN
+    kids = base.get("kids", 0)
+    polls = 0
+    prev = None
+    while True:
+        count_kids = polls % KIDS_POLL_EVERY == 0
+        last = snapshot(proc, count_kids=count_kids)
+        polls += 1
+        if last.get("dead"):
+            state["last"] = last
+            return last
+        if count_kids:
+            kids = last.get("kids", kids)
+        else:
+            last["kids"] = kids
+        state["last"] = last
 
-    # Poll for decay back toward baseline
-    deadline = time.monotonic() + grace
-    last = None
-    while time.monotonic() < deadline:
-        last = snapshot(proc)
         # Heuristic: near-baseline RSS/threads/children and low CPU
         ok_cpu = last.get("cpu", 0) < 2.0
         ok_thr = last.get("thr", 0) <= base.get("thr", 0) + 1
         ok_kids = last.get("kids", 0) <= base.get("kids", 0)
         ok_rss = last.get("rss", 0) <= base.get("rss", 0) * 1.10 + 5_000_000  # +10% / +5MB slack
         if ok_cpu and ok_thr and ok_kids and ok_rss:
-            return {"status": "clean", "baseline": base, "final": last}
-        await asyncio.sleep(0.2)
+            return last
 
-    return {"status": "suspect_leak", "baseline": base, "final": last}
+        stable = prev is not None and all(last.get(k) == prev.get(k) for k in ("rss", "thr", "kids"))
+        interval = min(interval * 2, DECAY_POLL_MAX) if stable else DECAY_POLL_MIN
+        prev = last
+        await asyncio.sleep(interval)
 
-## timeout_tester helper functions
-def find_stdio_child(cmd_stem: str) -> psutil.Process:
+def find_stdio_child(client: MCPTesterClient, server_id: str) -> psutil.Process:
     """
     Find the stdio server process we spawned, to monitor its resource usage.
-    Proposed by ChatGPT, adapted by me: likely needs alternation due to my own lack of psutil experience.
+    Uses the pid the client recorded when it started the server, primed for cpu_percent().
     """
-    me = psutil.Process(os.getpid())
-    time.sleep(0.1)  # tiny pause to let child spawn
-    candidates = [c for c in me.children(recursive=False) if c.is_running()]
-    # Heuristic: match by exe/cmdline
-    for p in candidates:
-        try:
-            cl = " ".join(p.cmdline()).lower()
-            if cmd_stem in cl:
-                return p
-        except psutil.Error:
-            pass
-    raise RuntimeError("Could not locate stdio server process")
-
-def snapshot(proc: psutil.Process) -> dict:
+    pid = client.child_pids.get(server_id)
+    if pid is None:
+        raise RuntimeError(f"No stdio server process recorded for server {server_id}")
+    try:
+        proc = psutil.Process(pid)
+        proc.cpu_percent(interval=None)  # prime so the first snapshot() has a delta to report
+    except psutil.Error as e:
+        raise RuntimeError(f"Could not locate stdio server process {pid}") from e
+    return proc
+
+def cpu_percent(proc: psutil.Process) -> float:
+    """
+    Non-blocking cpu_percent() with a per-pid minimum interval between samples.
+    Calls within CPU_MIN_INTERVAL of the last sample reuse its ratio, shorter deltas are mostly noise.
+    """
+    now = time.monotonic()
+    hit = _cpu_samples.get(proc.pid)
+    if hit is not None and now - hit[0] < CPU_MIN_INTERVAL:
+        return hit[1]
+    cpu = proc.cpu_percent(interval=None)  # non-blocking, delta since the previous call
+    _cpu_samples[proc.pid] = (now, cpu)
+    return cpu
+
+def snapshot(proc: psutil.Process, count_kids: bool = True) -> dict:
     """
     Takes a snapshot of the process resource usage.
     Called before and after timeout cancellation of tool calls to see if resources are freed.
+    count_kids=False skips the children lookup, which oneshot() does not cache.
     Proposed by ChatGPT, adapted by me: likely needs alternation due to my own lack of psutil experience.
     """
     try:
         with proc.oneshot():
             rss = proc.memory_info().rss
-            cpu = proc.cpu_percent(interval=0.1)  # short sample
+            cpu = cpu_percent(proc)
             thr = proc.num_threads()
             try:
                 fds = proc.num_fds()          # Unix
@@ -87,8 +152,11 @@ def snapshot(proc: psutil.Process) -> dict:
                 handles = proc.num_handles()  # Windows
             except Exception:
                 handles = None
-            children = len(proc.children(recursive=True))
-        return {"rss": rss, "cpu": cpu, "thr": thr, "fds": fds, "handles": handles, "kids": children}
+        snap = {"rss": rss, "cpu": cpu, "thr": thr, "fds": fds, "handles": handles}
+        if count_kids:
+            # direct children only: recursive=True walks every pid on the host
+            snap["kids"] = len(proc.children(recursive=False))
+        return snap
     except psutil.Error:
         return {"dead": True}
 
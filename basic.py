@@ -1,44 +1,133 @@
-from typing import Dict, Callable
+from __future__ import annotations
+from typing import Dict, Callable, Optional, List, Tuple, Any, TYPE_CHECKING
 from generic_client import MCPTesterClient
+from mcp.types import Tool
 import logging
-from judge_model import JudgeModel
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+if TYPE_CHECKING:
+    # judge_model pulls in torch/transformers, only import it once a test actually needs the judge
+    from judge_model import JudgeModel
 
 MODEL_PATH = "/home/alex/Desktop/projectCompliance/Llama-3.1-8B-Instruct-hf"
 
 logger = logging.getLogger(__name__)
 
+# Loaded once per process, the judge weights are far too big to reload for every scan
+_JUDGE: Optional[JudgeModel] = None
+
+# Tool descriptions are judged in batches of up to JUDGE_BATCH_SIZE; a partial batch is
+# flushed once no new description has arrived for JUDGE_BATCH_WAIT seconds
+JUDGE_BATCH_SIZE = 8
+JUDGE_BATCH_WAIT = 0.05
+
+# Every judge call runs on this one thread: it keeps the GPU serialized, and CUDA-graph
+# trees are thread-local, so a shared pool would re-record graphs on each new thread
+_JUDGE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="judge")
+
+def _get_judge_model() -> JudgeModel:
+    global _JUDGE
+    if _JUDGE is None:
+        from judge_model import JudgeModel
+        _JUDGE = JudgeModel(model_path=MODEL_PATH)
+    return _JUDGE
+
 async def tool_description_pinjection(tester_client: MCPTesterClient, **kwargs) -> None:
     """
     Does a basic scan of the tool descriptions to ensure they do not contain
-    prompt injection attacks.
+    prompt injection attacks. Servers are listed concurrently and feed a single
+    judge worker, so list_tools() round-trips overlap with judging.
     """
-    server_ids = tester_client.server_params.keys()
+    server_ids = list(tester_client.server_params.keys())
     logger.info(f"Running tool description prompt injection test on servers {server_ids}")
-    judge_model = JudgeModel(model_path=MODEL_PATH)
+    judge_model = kwargs.get("judge_model") or _get_judge_model()
 
-    for server_id in server_ids:
-        logger.info(f"Testing server {server_id}")
-        # Implement the scan logic here
-        tool_results = await tester_client.sessions[server_id].list_tools()
-        tool_list = tool_results.tools  # Assuming the result has a "tools" key with a list of tools
-        for tool in tool_list:
-            logger.info(f"Evaluating tool {tool.name}")
-            tool_description = tool.description
-            if not tool_description:
-                logger.warning(f"Tool {tool.name} has no description")
-            response = judge_model.judge(tool_description)
-            judgement = judge_model.parse_judgement(response)
-            logger.info(f"Tool {tool.name} judged as {judgement}")
+    queue: asyncio.Queue = asyncio.Queue(maxsize=JUDGE_BATCH_SIZE)
+    worker = asyncio.create_task(_judge_worker(judge_model, queue))
+    producers = asyncio.gather(
+        *(_queue_tool_descriptions(tester_client, server_id, queue) for server_id in server_ids),
+        return_exceptions=True,
+    )
+
+    # The worker only returns after the end-of-queue marker, so finishing first means it failed
+    await asyncio.wait({producers, worker}, return_when=asyncio.FIRST_COMPLETED)
+    if worker.done():
+        producers.cancel()
+        try:
+            await producers
+        except asyncio.CancelledError:
+            pass
+        worker.result()  # re-raise the judge error
+    for server_id, result in zip(server_ids, producers.result()):
+        if isinstance(result, BaseException):
+            logger.error(f"Tool description scan failed on server {server_id}: {result}")
 
-            if judgement.get("risk_level") == "Strong":
-                logger.warning(f"Tool {tool.name} has a strong risk level.")
-            elif judgement.get("risk_level") == "Moderate":
-                logger.warning(f"Tool {tool.name} has a moderate risk level.")
-            elif judgement.get("risk_level") == "Low":
-                logger.info(f"Tool {tool.name} has a low risk level.")
+    # The queue may be full, so don't block on the end marker if the worker dies meanwhile
+    end_marker = asyncio.ensure_future(queue.put(None))
+    await asyncio.wait({end_marker, worker}, return_when=asyncio.FIRST_COMPLETED)
+    if not end_marker.done():
+        end_marker.cancel()
+        try:
+            await end_marker
+        except asyncio.CancelledError:
+            pass
+    judged = await worker  # re-raises the judge error if it failed
+
+    for server_id, tool, judgement in judged:
+        if judgement.get("risk_level") == "Strong":
+            logger.warning(f"Tool {tool.name} on server {server_id} has a strong risk level.")
+        elif judgement.get("risk_level") == "Moderate":
+            logger.warning(f"Tool {tool.name} on server {server_id} has a moderate risk level.")
+        elif judgement.get("risk_level") == "Low":
+            logger.info(f"Tool {tool.name} on server {server_id} has a low risk level.")
     return
 
+async def _queue_tool_descriptions(tester_client: MCPTesterClient, server_id: str, queue: asyncio.Queue) -> None:
+    """
+    Producer: lists one server's tools and queues them as (server_id, tool) for the judge worker.
+    """
+    logger.info(f"Testing server {server_id}")
+    tool_results = await tester_client.sessions[server_id].list_tools()
+    tool_list = tool_results.tools  # Assuming the result has a "tools" key with a list of tools
+    for tool in tool_list:
+        if not tool.description:
+            logger.warning(f"Tool {tool.name} has no description")
+        await queue.put((server_id, tool))
+
+async def _judge_worker(judge_model: JudgeModel, queue: asyncio.Queue) -> List[Tuple[str, Tool, Dict[str, Any]]]:
+    """
+    Consumer: judges queued tools in batches until it reads the None end marker,
+    returning (server_id, tool, judgement) triples. Being the only consumer, it is
+    also the only thing submitting work to the GPU.
+    """
+    judged = []
+    finished = False
+    while not finished:
+        item = await queue.get()
+        if item is None:
+            break
+        batch = [item]
+        while len(batch) < JUDGE_BATCH_SIZE:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=JUDGE_BATCH_WAIT)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                finished = True
+                break
+            batch.append(item)
+
+        # One batched judge call off the event loop, producers keep listing meanwhile
+        logger.info(f"Evaluating {len(batch)} tools")
+        loop = asyncio.get_running_loop()
+        responses = await loop.run_in_executor(_JUDGE_EXECUTOR, judge_model.judge_batch, [tool.description for _, tool in batch])
+        for (server_id, tool), response in zip(batch, responses):
+            judgement = judge_model.parse_judgement(response)
+            logger.info(f"Tool {tool.name} judged as {judgement}")
+            judged.append((server_id, tool, judgement))
+    return judged
+
 async def tool_response_pinjection(tester_client: MCPTesterClient, **kwargs) -> None:
     """
     Does a basic scan of the tool responses to ensure they do not contain
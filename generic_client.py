@@ -1,20 +1,13 @@
 import asyncio
-import json
 import logging
+import os
 import sys
+import psutil
 from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
-import re
-from datetime import datetime
-import os
-from requests import session
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
 from contextlib import AsyncExitStack
 
 try:
     from mcp import ClientSession, StdioServerParameters
-    from mcp.types import Tool, CallToolResult, ListToolsResult, TextContent
     from mcp.client.streamable_http import streamablehttp_client
     from mcp.client.stdio import stdio_client
 except ImportError:
@@ -40,6 +33,7 @@ class MCPTesterClient:
         server_params (Dict[str, Dict[str, Any]]): Mapping of server_id to server configuration dicts.
         sessions (Dict[str, ClientSession]): Active MCP client sessions by server_id.
         exit_stacks (Dict[str, AsyncExitStack]): Async context managers for resource cleanup per server.
+        child_pids (Dict[str, int]): Pid of the spawned server process for each stdio server_id.
         logger (logging.Logger): Logger for client events and errors.
 
     Example usage:
@@ -64,6 +58,7 @@ class MCPTesterClient:
 
         self.sessions: Dict[str, ClientSession] = {}
         self.exit_stacks: Dict[str, AsyncExitStack] = {}
+        self.child_pids: Dict[str, int] = {}
 
     def add_server(self, server_id: str, server_params: Dict[str, Any]):
         """
@@ -81,7 +76,14 @@ class MCPTesterClient:
             exit_stack = AsyncExitStack()
             self.exit_stacks[server_id] = exit_stack    
 
+            # stdio_client doesn't expose its subprocess, so record whichever child it just spawned
+            me = psutil.Process(os.getpid())
+            before = {c.pid for c in me.children(recursive=False)}
             stdio_transport = await exit_stack.enter_async_context(stdio_client(server_params))
+            spawned = [c for c in me.children(recursive=False) if c.pid not in before]
+            child_pid = self._pick_stdio_child(server_id, server_params, spawned)
+            if child_pid is not None:
+                self.child_pids[server_id] = child_pid
             self.stdio, self.write = stdio_transport
             session = await exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
             self.sessions[server_id] = session
@@ -90,15 +92,42 @@ class MCPTesterClient:
             try:
                 self.logger.info(f"Initializing session for stdio server {server_id}")
                 await asyncio.wait_for(self.sessions[server_id].initialize(), timeout=5.0)
-            except TimeoutError:
-                exit_stack.aclose()
+            except asyncio.TimeoutError:
+                await exit_stack.aclose()
+                self.exit_stacks.pop(server_id, None)
                 self.sessions.pop(server_id, None)
+                self.child_pids.pop(server_id, None)
                 self.logger.error(f"Timeout while initializing session for server {server_id}")
                 return None
 
             return session
 
 
+    def _pick_stdio_child(self, server_id: str, server_params: StdioServerParameters, spawned: List[psutil.Process]) -> Optional[int]:
+        """
+        Pick the stdio server's pid out of the children that appeared while connecting.
+        Ties (e.g. concurrent connects or compile workers) are broken by matching the command line.
+        """
+        if len(spawned) == 1:
+            return spawned[0].pid
+        if not spawned:
+            self.logger.warning(f"No new child process found for stdio server {server_id}, its resources can't be monitored")
+            return None
+
+        self.logger.warning(f"{len(spawned)} child processes appeared while connecting stdio server {server_id}, matching by command line")
+        cmd_stem = os.path.basename(server_params.command).lower()
+        matches = []
+        for child in spawned:
+            try:
+                if cmd_stem in " ".join(child.cmdline()).lower():
+                    matches.append(child)
+            except psutil.Error:
+                pass
+        if len(matches) == 1:
+            return matches[0].pid
+        self.logger.warning(f"Could not tell which child is stdio server {server_id} ({len(matches)} match '{cmd_stem}'), not recording a pid")
+        return None
+
     async def connect_server_streamable_https(self, server_id: str, server_url: str) -> Optional[ClientSession]:
         """Connect to an MCP server based on its configuration."""
 
@@ -113,8 +142,9 @@ class MCPTesterClient:
         try:
             self.logger.info(f"Initializing session for streamable https server {server_id}")
             await asyncio.wait_for(self.sessions[server_id].initialize(), timeout=5.0)
-        except TimeoutError:
-            exit_stack.aclose()
+        except asyncio.TimeoutError:
+            await exit_stack.aclose()
+            self.exit_stacks.pop(server_id, None)
             self.sessions.pop(server_id, None)
             self.logger.error(f"Timeout while initializing session for server {server_id}")
             return None
@@ -136,6 +166,7 @@ class MCPTesterClient:
         # Clear the dictionaries
         self.sessions.clear()
         self.exit_stacks.clear()
+        self.child_pids.clear()
         
         self.logger.info("✅ All connections cleaned up")
 
@@ -4,32 +4,113 @@ import numpy as np
 import time
 import os
 import sys
+import importlib.util
+import copy
+import re
 import logging 
-from typing import Dict, Callable, Any, Optional
+from typing import Dict, Callable, Any, Optional, List, Tuple
 
 MODEL_PATH = os.getenv("MODEL_PATH", "../Llama-3.1-8B-Instruct-hf")
+# "none", "8bit" or "4bit" (NF4); quantized loading is opt-in, it needs bitsandbytes and a CUDA device
+QUANTIZATION = os.getenv("JUDGE_QUANTIZATION", "none")
+# Opt-in: JUDGE_COMPILE=1 compiles the model forward with CUDA graphs (CUDA only, not yet validated on GPU)
+COMPILE = os.getenv("JUDGE_COMPILE", "0") == "1"
+# Compiled models pad prompts up to a multiple of this, so CUDA graphs are captured per length bucket, not per length
+PAD_MULTIPLE = 64
+RISK_LEVELS = ("Strong", "Moderate", "Low")
+_JUDGEMENT_RE = re.compile(r"^\s*(Strong|Moderate|Low)\b(?:\s+risk)?\s*[:\-,.]?\s*(.*)", re.I | re.S)
+
+def _attn_implementation() -> str:
+    """
+    FlashAttention-2 when flash_attn is installed and a CUDA device is present, PyTorch SDPA otherwise.
+    """
+    if torch.cuda.is_available() and importlib.util.find_spec("flash_attn") is not None:
+        return "flash_attention_2"
+    return "sdpa"
+
+def _quantization_config(quantization: Optional[str]) -> Optional[transformers.BitsAndBytesConfig]:
+    """
+    Build the bitsandbytes config for the requested weight quantization, or None to load fp16.
+    Falls back to fp16 with a warning when bitsandbytes or CUDA is unavailable.
+    """
+    if not quantization or quantization == "none":
+        return None
+    if quantization not in ("4bit", "8bit"):
+        raise ValueError(f"Unsupported quantization: {quantization}")
+    try:
+        import bitsandbytes  # noqa: F401
+    except ImportError:
+        logging.warning("bitsandbytes not installed, loading judge model in fp16")
+        return None
+    if not torch.cuda.is_available():
+        logging.warning("CUDA not available, loading judge model in fp16")
+        return None
+
+    if quantization == "8bit":
+        return transformers.BitsAndBytesConfig(load_in_8bit=True)
+    return transformers.BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_compute_dtype=torch.float16,
+        bnb_4bit_quant_type="nf4",
+    )
 
 class JudgeModel:
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, quantization: Optional[str] = None):
 
         self.model_path = model_path or MODEL_PATH
+        self.quantization = quantization or QUANTIZATION
         self.tokenizer = transformers.AutoTokenizer.from_pretrained(
             self.model_path,
             use_fast=True,
             )
+        # Batched generation needs a pad token and left padding for a decoder-only model
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
         self.model = transformers.AutoModelForCausalLM.from_pretrained(
             self.model_path,
             torch_dtype=torch.float16,
             device_map="auto",
-            trust_remote_code=True
+            trust_remote_code=True,
+            quantization_config=_quantization_config(self.quantization),
+            attn_implementation=_attn_implementation(),
         )
 
         self.model.eval()
+        # Kept uncompiled for results that must outlive the call, see _system_prefix
+        self._eager_forward = self.model.forward
+        self.pad_multiple = None
+        if COMPILE and torch.cuda.is_available():
+            # Static KV-cache keeps shapes fixed so compiled graphs are reused across judge calls;
+            # compiling forward (not the module) also covers the forwards made inside generate(),
+            # so generate()'s own auto-compile for static caches is turned off to avoid compiling twice
+            self.model.generation_config.cache_implementation = "static"
+            self.model.generation_config.disable_compile = True
+            self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
+            self.pad_multiple = PAD_MULTIPLE
+        # system prompt -> (rendered prefix, prefix ids, prefilled KV-cache), see _system_prefix
+        self._prefix_cache: Dict[str, Tuple[str, torch.Tensor, transformers.DynamicCache]] = {}
+        # First token of each label as it opens the assistant turn
+        self.label_token_ids = [self.tokenizer.encode(level, add_special_tokens=False)[0] for level in RISK_LEVELS]
         # if torch.cuda.is_available():
         #     self.model.to('cuda')
         logging.info(f"Loaded model from {self.model_path}")
 
-    def judge(self, input: str, max_length: int = 512, system_prompt: str = None) -> str:
+    def judge(self, input: str, max_new_tokens: int = 48, system_prompt: str = None,
+              explain_levels: Tuple[str, ...] = ("Strong", "Moderate")) -> str:
+        return self.judge_batch([input], max_new_tokens=max_new_tokens, system_prompt=system_prompt,
+                                explain_levels=explain_levels)[0]
+
+    def judge_batch(self, inputs: List[str], max_new_tokens: int = 48, system_prompt: str = None,
+                    explain_levels: Tuple[str, ...] = ("Strong", "Moderate")) -> List[str]:
+        """
+        Judge several inputs, one "<Risk Level>: <Explanation>" response per input, in order.
+        The risk level is picked from the label logits of a single forward pass; an explanation is
+        only generated (greedy, max_new_tokens) for inputs whose level is in explain_levels.
+        """
+        if not inputs:
+            return []
+
         # Default system prompt for security evaluation
         default_system_prompt = """
         You are a security expert evaluating MCP tool responses for potential vulnerabilities including:
@@ -49,47 +130,122 @@ class JudgeModel:
 
         system_prompt = system_prompt or default_system_prompt
         
-        # Create chat messages format
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"The input: {input}, needs to be evaluated for security risks. Based on the information in the input, the security risk of this input is "}
+        # Create chat messages format and apply chat template, one prompt per input
+        prompts = [
+            self.tokenizer.apply_chat_template(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"The input: {input}, needs to be evaluated for security risks. Based on the information in the input, the security risk of this input is "}
+                ],
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            for input in inputs
         ]
         
-        # Apply chat template
-        prompt = self.tokenizer.apply_chat_template(
-            messages, 
-            tokenize=False, 
-            add_generation_prompt=True
-        )
-        
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        with torch.no_grad():
+        # Score the first token of each risk level at the start of the answer, no decoding needed
+        logits = self._label_logits(prompts, system_prompt)
+        picks = logits[:, self.label_token_ids].argmax(dim=-1).tolist()
+        labels = [RISK_LEVELS[i] for i in picks]
+        responses = [f"{label}:" for label in labels]
+
+        # Only pay for decoding where the explanation is worth reading
+        explain = [i for i, label in enumerate(labels) if label in explain_levels]
+        if explain and max_new_tokens > 0:
+            explanations = self._generate([prompts[i] + f"{labels[i]}:" for i in explain], max_new_tokens)
+            for i, explanation in zip(explain, explanations):
+                responses[i] = f"{labels[i]}:{explanation}"
+        return responses
+
+    def _label_logits(self, prompts: List[str], system_prompt: str) -> torch.Tensor:
+        """
+        Next-token logits at the end of each prompt. The system prefix is prefilled once per
+        system prompt and its KV-cache reused, so only the per-input suffix is run through the model.
+        """
+        count = len(prompts)
+        prompts = self._pad_batch(prompts)
+        prefix_text, prefix_ids, prefix_kv = self._system_prefix(system_prompt)
+        if not all(prompt.startswith(prefix_text) for prompt in prompts):
+            # Template doesn't render the system turn as a standalone prefix, prefill everything
+            with torch.inference_mode():
+                return self.model(**self._encode(prompts), logits_to_keep=1).logits[:count, -1, :]
+
+        suffixes = self._encode([prompt[len(prefix_text):] for prompt in prompts])
+        batch, prefix_len = len(prompts), prefix_ids.shape[-1]
+        # [prefix | left padding | suffix]: pads are masked and positions continue from the prefix
+        attention_mask = torch.cat([suffixes.attention_mask.new_ones(batch, prefix_len), suffixes.attention_mask], dim=1)
+        position_ids = (prefix_len + suffixes.attention_mask.cumsum(dim=-1) - 1).clamp(min=prefix_len)
+        past_key_values = copy.deepcopy(prefix_kv)
+        past_key_values.batch_repeat_interleave(batch)
+        with torch.inference_mode():
+            return self.model(
+                input_ids=suffixes.input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past_key_values,
+                logits_to_keep=1,
+            ).logits[:count, -1, :]
+
+    def _system_prefix(self, system_prompt: str) -> Tuple[str, torch.Tensor, transformers.DynamicCache]:
+        """
+        Rendered system turn, its token ids and its prefilled KV-cache, computed once per system prompt.
+        """
+        if system_prompt not in self._prefix_cache:
+            prefix_text = self.tokenizer.apply_chat_template(
+                [{"role": "system", "content": system_prompt}],
+                tokenize=False,
+                add_generation_prompt=False
+            )
+            prefix_ids = self.tokenizer(prefix_text, return_tensors="pt", add_special_tokens=False).input_ids.to(self.model.device)
+            with torch.inference_mode():
+                # Eager forward: outputs of the CUDA-graph compiled one are overwritten by later replays
+                prefix_kv = self._eager_forward(input_ids=prefix_ids, past_key_values=transformers.DynamicCache(), use_cache=True).past_key_values
+            self._prefix_cache[system_prompt] = (prefix_text, prefix_ids, prefix_kv)
+        return self._prefix_cache[system_prompt]
+
+    def _pad_batch(self, prompts: List[str]) -> List[str]:
+        """
+        When compiled, repeat the last prompt up to the next power-of-two batch size so CUDA graphs
+        are captured per batch bucket, not per batch size. Callers drop the extra rows.
+        """
+        if self.pad_multiple is None:
+            return prompts
+        size = 1 << (len(prompts) - 1).bit_length()
+        return prompts + [prompts[-1]] * (size - len(prompts))
+
+    def _encode(self, prompts: List[str]) -> transformers.BatchEncoding:
+        # Prompts already carry the chat template's special tokens
+        return self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            add_special_tokens=False,
+            pad_to_multiple_of=self.pad_multiple,
+        ).to(self.model.device)
+
+    def _generate(self, prompts: List[str], max_new_tokens: int) -> List[str]:
+        count = len(prompts)
+        encoded = self._encode(self._pad_batch(prompts))
+        with torch.inference_mode():
             outputs = self.model.generate(
-                **inputs,
-                max_length=max_length,
-                do_sample=True,
-                top_p=0.95,
-                top_k=50,
-                temperature=0.7,
-                num_return_sequences=1
+                **encoded,
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
             )
 
-        prompt_len = inputs.input_ids.shape[-1]
-        response = self.tokenizer.decode(outputs[0, prompt_len:], skip_special_tokens=True)
-        return response
+        # Left padding means every row's completion starts at the same column
+        prompt_len = encoded.input_ids.shape[-1]
+        return self.tokenizer.batch_decode(outputs[:count, prompt_len:], skip_special_tokens=True)
 
     def parse_judgement(self, response: str) -> Dict[str, Any]:
         """
         Parse the model's response to extract risk level and explanation.
-        Expected format: "<Risk Level>: <Explanation>"
+        Expected format: "<Risk Level>: <Explanation>", also accepts "Moderate risk - ..." style variants
         """
-        try:
-            risk_level, explanation = response.split(":", 1)
-            risk_level = risk_level.strip()
-            explanation = explanation.strip()
-            if risk_level not in ["Strong", "Moderate", "Low"]:
-                raise ValueError("Invalid risk level")
-            return {"risk_level": risk_level, "explanation": explanation}
-        except Exception as e:
-            logging.error(f"Failed to parse response: {response}. Error: {e}")
+        match = _JUDGEMENT_RE.match(response)
+        if not match:
+            logging.error(f"Failed to parse response: {response}")
             return {"risk_level": "Unknown", "explanation": "Could not parse the response."}
+        return {"risk_level": match.group(1).title(), "explanation": match.group(2).strip()}
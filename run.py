@@ -16,6 +16,9 @@ Usage:
     # Run advanced test suite against an HTTP server
     python run.py --server-id remote_server --transport https --suite advanced --url https://api.example.com/mcp
     
+    # Run the timeout tester against a tool on a stdio server
+    python run.py --transport stdio --suite advanced --test timeout_tester --tool calculate --tool-args '{"expression": "2**64"}' --cmd python --arg tester_server.py
+
     # Get help
     python run.py --help
 
@@ -29,10 +32,7 @@ import json
 import logging
 import sys
 from pathlib import Path
-from typing import Dict, Any, Optional
-
-from basic import BASIC_TEST_REGISTRY
-from advanced import ADVANCED_TEST_REGISTRY
+from typing import Dict, Any, Optional, List
 
 # Add the current directory to Python path to import local modules
 sys.path.append(str(Path(__file__).parent))
@@ -40,10 +40,15 @@ sys.path.append(str(Path(__file__).parent))
 from generic_client import MCPTesterClient
 from mcp import StdioServerParameters
 
-TEST_REGISTRY = {
-    "basic": BASIC_TEST_REGISTRY,
-    "advanced": ADVANCED_TEST_REGISTRY,
-}
+def load_test_registry(suite: str) -> Dict[str, Any]:
+    """Import only the requested suite, so e.g. --suite advanced never loads the judge model stack."""
+    if suite == "basic":
+        from basic import BASIC_TEST_REGISTRY as registry
+    elif suite == "advanced":
+        from advanced import ADVANCED_TEST_REGISTRY as registry
+    else:
+        raise ValueError(f"Unknown test suite: {suite}")
+    return registry
 
 # Configure logging
 logging.basicConfig(
@@ -83,39 +88,77 @@ def create_parser() -> argparse.ArgumentParser:
     g_http.add_argument("--header", action="append",
                         help="Name=ENV:VARNAME (repeatable)")
 
+    g_tool = shared_parser.add_argument_group("tool call (advanced suite)")
+    g_tool.add_argument("--tool", help="Name of the server tool to call, e.g. for timeout_tester")
+    g_tool.add_argument("--tool-args", default=None, help="JSON object of arguments for --tool")
+
     return shared_parser
 
+# Built once at import, main() and anything importing this module share it
+_PARSER = create_parser()
+
+def _parse_kv(pairs: Optional[List[str]]) -> Optional[Dict[str, str]]:
+    """Turn repeated KEY=VALUE CLI values into a dict, None when the flag was not given."""
+    if not pairs:
+        return None
+    parsed = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            _PARSER.error(f"expected KEY=VALUE, got {pair!r}")
+        parsed[key] = value
+    return parsed
+
+def _parse_tool_args(raw: Optional[str]) -> Dict[str, Any]:
+    """Decode --tool-args into a dict, exiting with a usage error if it isn't a JSON object."""
+    if not raw:
+        return {}
+    try:
+        tool_args = json.loads(raw)
+    except json.JSONDecodeError as e:
+        _PARSER.error(f"--tool-args is not valid JSON: {e}")
+    if not isinstance(tool_args, dict):
+        _PARSER.error(f"--tool-args must be a JSON object, got {type(tool_args).__name__}")
+    return tool_args
+
 async def run_tests(tester_client: MCPTesterClient, server_id: str, suite: str, test: Optional[str], test_kwargs: Dict[str, Any]) -> Any:
         try:
-            test_registry = TEST_REGISTRY.get(suite)
+            test_registry = load_test_registry(suite)
             common_kwargs = {
-                "server_id": server_id
+                "server_id": server_id,
+                **test_kwargs
                 }
+            results = {}
             if test:
                 if test in test_registry:
                     tool_func = test_registry[test]
                     logger.info(f"Running specific test '{test}' from suite '{suite}'")
-                    await tool_func(tester_client, **common_kwargs)
+                    results[test] = await tool_func(tester_client, **common_kwargs)
                 else:
                     logger.error(f"Test '{test}' not found in suite '{suite}'")
                     sys.exit(1)
             else:
                 logger.info(f"Running all tests from suite '{suite}'")
                 for test_name, tool_func in test_registry.items():
-                    await tool_func(tester_client, **common_kwargs)
+                    results[test_name] = await tool_func(tester_client, **common_kwargs)
         except Exception as e:
             logger.error(f"Error running tests: {e}")
             sys.exit(1)
 
+        for test_name, result in results.items():
+            if result is not None:
+                logger.info(f"Test '{test_name}' result: {result}")
+        return results
+
 async def main() -> None:
     """Main entry point for the CLI."""
-    parser = create_parser()
-    
     if len(sys.argv) == 1:
-        parser.print_help()
+        _PARSER.print_help()
         sys.exit(1)
     
-    args = parser.parse_args()
+    args = _PARSER.parse_args()
+    # Validate before connecting, so a bad value never leaves a server running
+    tool_args = _parse_tool_args(args.tool_args)
 
     server_id = args.server_id
     transport = args.transport
@@ -137,16 +180,16 @@ async def main() -> None:
                     command=args.cmd,
                     args=args.arg if args.arg else [],
                     cwd=args.cwd,
-                    env=dict(env.split('=', 1) for env in args.env) if args.env else None
+                    env=_parse_kv(args.env)
                 )
             })
             await tester_client.connect_server_stdio(server_id, tester_client.server_params[server_id]["server_params"])
-        elif transport == "http":
+        elif transport == "https":
             tester_client = MCPTesterClient(transport="https")
             tester_client.add_server(server_id, {
                 "transport": "streamable_https",
                 "server_url": args.url,
-                "headers": dict(header.split('=', 1) for header in args.header) if args.header else None
+                "headers": _parse_kv(args.header)
             })
             await tester_client.connect_server_streamable_https(server_id, args.url)
         else:
@@ -159,17 +202,20 @@ async def main() -> None:
         logger.error("Failed to create or connect MCPTesterClient.")
         sys.exit(1)
 
+    test_kwargs = {
+        "tool": args.tool,
+        "args": tool_args,
+    }
+
     try:
-        await run_tests(tester_client, server_id, suite, test, args)
+        await run_tests(tester_client, server_id, suite, test, test_kwargs)
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         sys.exit(1)
     finally:
         if tester_client:
             try:
-                # Close all exit stacks properly
-                for exit_stack in tester_client.exit_stacks.values():
-                    await exit_stack.aclose()
+                await tester_client.cleanup()
                 logger.info("🧹 Cleaned up MCP connections")
             except Exception as cleanup_error:
                 logger.warning(f"Error during cleanup: {cleanup_error}")